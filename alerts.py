@@ -0,0 +1,22 @@
+def is_triggered(direction, current_price, target_price):
+    if direction == "up":
+        return current_price >= target_price
+    if direction == "down":
+        return current_price <= target_price
+    return False
+
+def evaluate_alerts(alerts, prices):
+    """Return (alert, current_price) pairs for every alert whose target was hit.
+
+    `alerts` are (user_id, crypto, target_price, direction) rows as returned by
+    get_active_alerts(); `prices` is the CoinGecko simple/price payload.
+    """
+    triggered = []
+    for alert in alerts:
+        _, crypto, target_price, direction = alert
+        current_price = prices.get(crypto, {}).get('usd')
+        if current_price is None:
+            continue
+        if is_triggered(direction, current_price, target_price):
+            triggered.append((alert, current_price))
+    return triggered
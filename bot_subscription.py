@@ -1,7 +1,13 @@
 import os
+import time
+import threading
+import logging
 import requests
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import CallbackContext
+from telegram.ext import CallbackContext, CommandHandler, CallbackQueryHandler
+
+import metrics
+from db import init_db, save_pending_invoice, get_pending_invoice, delete_expired_invoices
 
 # Load from .env
 CRYPTOMUS_PAYMENT_KEY = os.getenv("CRYPTOMUS_PAYMENT_KEY")
@@ -13,6 +19,15 @@ PRICES = {
     "yearly": 100    # USD
 }
 
+CRYPTOMUS_PAYMENT_API = "https://api.cryptomus.com/v1/payment"
+INVOICE_LIFETIME_SECONDS = 3600  # Cryptomus default invoice lifetime
+INVOICE_CLEANUP_SECONDS = 600
+METRICS_LOG_SECONDS = 300
+
+# (user_id, plan) pairs whose invoice is being created right now
+_invoices_in_progress = set()
+_invoices_lock = threading.Lock()
+
 # ---------------------------
 # /subscribe command
 # ---------------------------
@@ -25,23 +40,10 @@ def subscribe(update: Update, context: CallbackContext):
     update.message.reply_text("Choose your subscription plan:", reply_markup=reply_markup)
 
 # ---------------------------
-# Handle button click
+# Invoice creation (runs off the dispatcher thread)
 # ---------------------------
-def handle_subscription(update: Update, context: CallbackContext):
-    query = update.callback_query
-    query.answer()
-
-    if query.data == "sub_monthly":
-        amount = PRICES["monthly"]
-        plan = "Monthly"
-    elif query.data == "sub_yearly":
-        amount = PRICES["yearly"]
-        plan = "Yearly"
-    else:
-        query.edit_message_text("❌ Invalid selection")
-        return
-
-    # Create Cryptomus invoice
+def create_invoice(query, amount, plan):
+    key = (query.from_user.id, plan.lower())
     payload = {
         "amount": str(amount),
         "currency": "USD",
@@ -56,16 +58,88 @@ def handle_subscription(update: Update, context: CallbackContext):
     }
 
     try:
-        response = requests.post("https://api.cryptomus.com/v1/payment",
-                                 json=payload, headers=headers)
-        data = response.json()
+        with metrics.timed("invoice.create"):
+            response = requests.post(CRYPTOMUS_PAYMENT_API,
+                                     json=payload, headers=headers, timeout=15)
+            data = response.json()
         if "result" in data:
-            payment_url = data["result"]["url"]
+            result = data["result"]
+            payment_url = result["url"]
+            expires_at = result.get("expired_at") or time.time() + INVOICE_LIFETIME_SECONDS
+            with metrics.timed("invoice.store"):
+                save_pending_invoice(key[0], key[1], "cryptomus", result.get("uuid"),
+                                     payment_url, expires_at)
+            metrics.increment("invoice.created")
             query.edit_message_text(
                 text=f"✅ Please complete your {plan} payment:\n{payment_url}"
             )
         else:
+            metrics.increment("invoice.failed")
             query.edit_message_text("⚠️ Payment error. Try again later.")
 
     except Exception as e:
+        metrics.increment("invoice.failed")
+        logging.error(f"Cryptomus API Error: {e}")
         query.edit_message_text(f"❌ Error: {str(e)}")
+    finally:
+        with _invoices_lock:
+            _invoices_in_progress.discard(key)
+
+# ---------------------------
+# Handle button click
+# ---------------------------
+def handle_subscription(update: Update, context: CallbackContext):
+    query = update.callback_query
+    query.answer()
+
+    if query.data == "sub_monthly":
+        amount = PRICES["monthly"]
+        plan = "Monthly"
+    elif query.data == "sub_yearly":
+        amount = PRICES["yearly"]
+        plan = "Yearly"
+    else:
+        query.edit_message_text("❌ Invalid selection")
+        return
+
+    # Reuse a still-payable invoice instead of creating a new one on every tap
+    key = (query.from_user.id, plan.lower())
+    with metrics.timed("invoice.lookup"):
+        pending = get_pending_invoice(*key)
+    if pending:
+        metrics.increment("invoice.reused")
+        query.edit_message_text(
+            text=f"✅ Please complete your {plan} payment:\n{pending[1]}"
+        )
+        return
+
+    with _invoices_lock:
+        if key in _invoices_in_progress:
+            # The placeholder from the first tap will be updated with the link
+            return
+        _invoices_in_progress.add(key)
+
+    query.edit_message_text("⏳ Creating your payment link...")
+    context.dispatcher.run_async(create_invoice, query, amount, plan)
+
+# ---------------------------
+# Background jobs
+# ---------------------------
+def cleanup_expired_invoices(context: CallbackContext):
+    with metrics.timed("invoice.cleanup"):
+        deleted = delete_expired_invoices()
+    if deleted:
+        logging.info(f"Removed {deleted} expired pending invoices")
+
+def log_metrics(context: CallbackContext):
+    metrics.log_snapshot()
+
+# ---------------------------
+# Setup
+# ---------------------------
+def register_handlers(dispatcher):
+    init_db()
+    dispatcher.add_handler(CommandHandler("subscribe", subscribe))
+    dispatcher.add_handler(CallbackQueryHandler(handle_subscription, pattern="^sub_"))
+    dispatcher.job_queue.run_repeating(cleanup_expired_invoices, interval=INVOICE_CLEANUP_SECONDS, first=0)
+    dispatcher.job_queue.run_repeating(log_metrics, interval=METRICS_LOG_SECONDS)
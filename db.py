@@ -11,6 +11,7 @@ def init_db():
     )""")
     conn.commit()
     conn.close()
+    init_pending_invoices()
 
 def add_subscription(user_id, days=30):
     expiry = int(time.time()) + days * 86400
@@ -38,3 +39,63 @@ def subscription_expiry(user_id):
     row = c.fetchone()
     conn.close()
     return row[0] if row else None
+
+# ---------------------------
+# Pending invoices (one still-payable invoice per user and plan)
+# ---------------------------
+def init_pending_invoices(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("""CREATE TABLE IF NOT EXISTS pending_invoices (
+        user_id INTEGER,
+        plan TEXT,
+        provider TEXT,
+        invoice_id TEXT,
+        payment_url TEXT,
+        expires_at INTEGER,
+        created_at INTEGER,
+        PRIMARY KEY (user_id, plan)
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS pending_invoices_expires_at ON pending_invoices (expires_at)")
+    conn.commit()
+    conn.close()
+
+def save_pending_invoice(user_id, plan, provider, invoice_id, payment_url, expires_at, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("""REPLACE INTO pending_invoices
+        (user_id, plan, provider, invoice_id, payment_url, expires_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (user_id, plan, provider, invoice_id, payment_url, int(expires_at), int(time.time())))
+    conn.commit()
+    conn.close()
+
+def get_pending_invoice(user_id, plan, min_remaining=300, db_name=DB_NAME):
+    """Return (invoice_id, payment_url, expires_at) if the invoice is payable for at least min_remaining seconds."""
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("""SELECT invoice_id, payment_url, expires_at FROM pending_invoices
+        WHERE user_id = ? AND plan = ? AND expires_at > ?""",
+        (user_id, plan, int(time.time()) + min_remaining))
+    row = c.fetchone()
+    conn.close()
+    return row
+
+def delete_pending_invoice(user_id, plan=None, db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    if plan is None:
+        c.execute("DELETE FROM pending_invoices WHERE user_id = ?", (user_id,))
+    else:
+        c.execute("DELETE FROM pending_invoices WHERE user_id = ? AND plan = ?", (user_id, plan))
+    conn.commit()
+    conn.close()
+
+def delete_expired_invoices(db_name=DB_NAME):
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute("DELETE FROM pending_invoices WHERE expires_at <= ?", (int(time.time()),))
+    deleted = c.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
@@ -1,8 +1,18 @@
 import os
 import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import statistics
 import importlib.util
 import requests
 
+from alerts import evaluate_alerts
+from prices import COINGECKO_API_URL
+
 REQUIRED_ENV_VARS = [
     "TELEGRAM_TOKEN",
     "PAYMENT_PROVIDER",
@@ -65,7 +75,207 @@ def check_telegram_token():
         print(f"❌ Error validating token: {e}")
         return False
 
+# ---------------------------
+# Performance self-test (--perf)
+# ---------------------------
+DEFAULT_DATABASE_PATH = os.getenv("DATABASE_PATH", "bot.db")
+DEFAULT_TELEGRAM_URL = "https://api.telegram.org"
+
+# Pass/fail thresholds in milliseconds (p95 unless noted)
+PERF_THRESHOLDS_MS = {
+    "sqlite_read": 20.0,
+    "sqlite_write": 50.0,
+    "event_loop_lag": 50.0,
+    "alert_evaluation": 500.0,   # one full pass over --alerts alerts
+    "price_rtt": 2000.0,
+    "telegram_rtt": 2000.0,
+}
+
+def log(message):
+    # Keep stdout clean for the JSON report
+    print(message, file=sys.stderr)
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    p95_index = max(0, int(round(0.95 * len(ordered))) - 1)
+    return {
+        "samples": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[p95_index], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+def perf_result(name, samples_ms, threshold_ms, error=None):
+    if error or not samples_ms:
+        result = {"passed": False, "threshold_ms": threshold_ms, "error": error or "no samples"}
+        log(f"❌ {name}: {result['error']}")
+        return result
+    result = summarize(samples_ms)
+    result["threshold_ms"] = threshold_ms
+    result["passed"] = result["p95_ms"] <= threshold_ms
+    mark = "✅" if result["passed"] else "❌"
+    log(f"{mark} {name}: p95 {result['p95_ms']}ms (limit {threshold_ms}ms)")
+    return result
+
+def perf_sqlite(db_path, iterations, read_threshold_ms, write_threshold_ms):
+    log(f"\n⏱  SQLite latency on {db_path}...")
+    reads, writes = [], []
+    try:
+        # mode=rw so a wrong path fails instead of benchmarking a fresh empty file
+        conn = sqlite3.connect(f"file:{db_path}?mode=rw", uri=True)
+        try:
+            # Scratch table so the real tables are never touched
+            conn.execute("CREATE TABLE IF NOT EXISTS perf_selftest (id INTEGER PRIMARY KEY, payload TEXT)")
+            conn.commit()
+            has_alerts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alerts'"
+            ).fetchone() is not None
+            read_sql = (
+                "SELECT user_id, crypto, target_price, direction FROM alerts WHERE is_active = 1"
+                if has_alerts else "SELECT id, payload FROM perf_selftest"
+            )
+            for i in range(iterations):
+                start = time.perf_counter()
+                conn.execute("INSERT INTO perf_selftest (payload) VALUES (?)", (f"sample-{i}",))
+                conn.commit()
+                writes.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                conn.execute(read_sql).fetchall()
+                reads.append((time.perf_counter() - start) * 1000)
+        finally:
+            conn.execute("DROP TABLE IF EXISTS perf_selftest")
+            conn.commit()
+            conn.close()
+    except sqlite3.Error as e:
+        return {
+            "sqlite_read": perf_result("sqlite_read", [], read_threshold_ms, str(e)),
+            "sqlite_write": perf_result("sqlite_write", [], write_threshold_ms, str(e)),
+        }
+    return {
+        "sqlite_read": perf_result("sqlite_read", reads, read_threshold_ms),
+        "sqlite_write": perf_result("sqlite_write", writes, write_threshold_ms),
+    }
+
+async def _sample_loop_lag(samples, interval):
+    lags = []
+    loop = asyncio.get_running_loop()
+    for _ in range(samples):
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected) * 1000)
+    return lags
+
+def perf_event_loop(samples, threshold_ms, interval=0.01):
+    log("\n⏱  Event-loop lag...")
+    lags = asyncio.run(_sample_loop_lag(samples, interval))
+    return {"event_loop_lag": perf_result("event_loop_lag", lags, threshold_ms)}
+
+def perf_alert_evaluation(alert_count, coin_count, iterations, threshold_ms):
+    log(f"\n⏱  Alert evaluation ({alert_count} alerts over {coin_count} coins)...")
+    rng = random.Random(42)
+    coins = [f"coin-{i}" for i in range(coin_count)]
+    prices = {coin: {"usd": rng.uniform(1, 100000)} for coin in coins}
+    alerts = [
+        (rng.randint(1, 10**9), rng.choice(coins), rng.uniform(1, 100000), rng.choice(("up", "down")))
+        for _ in range(alert_count)
+    ]
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        evaluate_alerts(alerts, prices)
+        timings.append((time.perf_counter() - start) * 1000)
+    result = perf_result("alert_evaluation", timings, threshold_ms)
+    result["alerts"] = alert_count
+    result["coins"] = coin_count
+    return {"alert_evaluation": result}
+
+def perf_rtt(name, url, iterations, threshold_ms, params=None):
+    log(f"\n⏱  Round-trip to {name}...")
+    timings = []
+    session = requests.Session()
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = session.get(url, params=params, timeout=10)
+            response.raise_for_status()
+            timings.append((time.perf_counter() - start) * 1000)
+    except requests.exceptions.RequestException as e:
+        return {name: perf_result(name, [], threshold_ms, str(e))}
+    finally:
+        session.close()
+    return {name: perf_result(name, timings, threshold_ms)}
+
+def run_perf(args):
+    log("=== ⏱  BOT PERFORMANCE SELF-TEST ===")
+    thresholds = dict(PERF_THRESHOLDS_MS)
+    for name in thresholds:
+        override = getattr(args, f"max_{name}_ms")
+        if override is not None:
+            thresholds[name] = override
+
+    checks = {}
+    checks.update(perf_sqlite(args.db, args.iterations, thresholds["sqlite_read"], thresholds["sqlite_write"]))
+    checks.update(perf_event_loop(args.iterations, thresholds["event_loop_lag"]))
+    checks.update(perf_alert_evaluation(args.alerts, args.coins, args.iterations, thresholds["alert_evaluation"]))
+    if not args.skip_network:
+        checks.update(perf_rtt("price_rtt", args.price_url, args.rtt_samples,
+                               thresholds["price_rtt"], params={"ids": "bitcoin", "vs_currencies": "usd"}))
+        token = os.getenv("TELEGRAM_TOKEN")
+        if token:
+            telegram_url = f"{args.telegram_url.rstrip('/')}/bot{token}/getMe"
+            checks.update(perf_rtt("telegram_rtt", telegram_url, args.rtt_samples, thresholds["telegram_rtt"]))
+        else:
+            checks["telegram_rtt"] = perf_result("telegram_rtt", [], thresholds["telegram_rtt"],
+                                                 "TELEGRAM_TOKEN not set")
+
+    report = {
+        "timestamp": int(time.time()),
+        "passed": all(check["passed"] for check in checks.values()),
+        "checks": checks,
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output + "\n")
+        log(f"\n📝 Report written to {args.report}")
+    else:
+        print(output)
+
+    log("\n=== SUMMARY ===")
+    if report["passed"]:
+        log("🎉 All performance checks passed.")
+    else:
+        failed = ", ".join(name for name, check in checks.items() if not check["passed"])
+        log(f"⚠️ Performance checks failed: {failed}")
+    return report["passed"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bot environment diagnostics")
+    parser.add_argument("--perf", action="store_true", help="run the performance self-test and emit a JSON report")
+    parser.add_argument("--db", default=DEFAULT_DATABASE_PATH, help="SQLite database to time (default: $DATABASE_PATH or bot.db)")
+    parser.add_argument("--iterations", type=int, default=50, help="samples per local check")
+    parser.add_argument("--alerts", type=int, default=10000, help="number of alerts in the evaluation benchmark")
+    parser.add_argument("--coins", type=int, default=250, help="number of distinct coins in the evaluation benchmark")
+    parser.add_argument("--rtt-samples", type=int, default=5, help="requests per endpoint round-trip check")
+    parser.add_argument("--price-url", default=os.getenv("PERF_PRICE_URL", COINGECKO_API_URL), help="price API endpoint")
+    parser.add_argument("--telegram-url", default=os.getenv("PERF_TELEGRAM_URL", DEFAULT_TELEGRAM_URL), help="Telegram Bot API base URL")
+    parser.add_argument("--skip-network", action="store_true", help="skip the endpoint round-trip checks")
+    parser.add_argument("--report", help="write the JSON report to this file instead of stdout")
+    for name, default in PERF_THRESHOLDS_MS.items():
+        parser.add_argument(f"--max-{name.replace('_', '-')}-ms", type=float, default=None,
+                            help=f"{name} threshold in ms (default: {default})")
+    args = parser.parse_args(argv)
+    if min(args.iterations, args.alerts, args.coins, args.rtt_samples) < 1:
+        parser.error("--iterations, --alerts, --coins and --rtt-samples must be at least 1")
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.perf:
+        sys.exit(0 if run_perf(args) else 1)
+
     print("=== 🤖 BOT DIAGNOSTICS ===")
     env_missing = check_env_vars()
     pkg_missing = check_packages()
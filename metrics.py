@@ -0,0 +1,46 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# name -> {"count", "total_ms", "max_ms"} for timers, name -> int for counters
+_timers = {}
+_counters = {}
+_lock = threading.Lock()
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            timer = _timers.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            timer["count"] += 1
+            timer["total_ms"] += elapsed_ms
+            timer["max_ms"] = max(timer["max_ms"], elapsed_ms)
+        logging.debug(f"{name} took {elapsed_ms:.1f}ms")
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def snapshot():
+    with _lock:
+        timers = {
+            name: {
+                "count": t["count"],
+                "avg_ms": round(t["total_ms"] / t["count"], 3),
+                "max_ms": round(t["max_ms"], 3),
+            }
+            for name, t in _timers.items()
+        }
+        return {"timers": timers, "counters": dict(_counters)}
+
+def log_snapshot():
+    """Log the current metrics; scheduled from whichever process runs the handlers."""
+    current = snapshot()
+    if current["timers"] or current["counters"]:
+        logging.info(f"metrics {json.dumps(current, sort_keys=True)}")
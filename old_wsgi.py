@@ -1,7 +1,10 @@
 import os
+import logging
 from dotenv import load_dotenv
 from telegram.ext import Updater, CommandHandler
 
+from bot_subscription import register_handlers
+
 # --- Load .env ---
 load_dotenv()
 
@@ -14,6 +17,7 @@ def help_command(update, context):
 
 # --- Main ---
 def main():
+    logging.basicConfig(level=logging.INFO)
     token = os.getenv("TELEGRAM_TOKEN")
     if not token:
         raise ValueError("❌ TELEGRAM_TOKEN not found. Please set it in your .env file.")
@@ -24,6 +28,7 @@ def main():
     dp = updater.dispatcher
     dp.add_handler(CommandHandler("start", start))
     dp.add_handler(CommandHandler("help", help_command))
+    register_handlers(dp)
 
     # Start bot
     updater.start_polling()
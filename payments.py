@@ -1,7 +1,7 @@
 import os, requests, json
 from flask import Flask, request
 from dotenv import load_dotenv
-from db import add_subscription
+from db import add_subscription, delete_pending_invoice
 
 load_dotenv()
 
@@ -32,6 +32,14 @@ def create_cryptomus_invoice(amount_usd, order_id, user_id):
     r = requests.post(CRYPTOMUS_API, headers=headers, data=json.dumps(data))
     return r.json()
 
+def parse_order_id(order_id):
+    """Split a bot_subscription order id ("<user_id>-<plan>") into (user_id, plan)."""
+    try:
+        user_id, plan = order_id.split("-", 1)
+        return int(user_id), plan
+    except (AttributeError, ValueError):
+        return None, None
+
 @app.route("/cryptomus/webhook", methods=["POST"])
 def cryptomus_webhook():
     payload = request.json
@@ -39,6 +47,12 @@ def cryptomus_webhook():
     status = payload.get("status")
     user_id = payload.get("user_id")
 
+    if status == "paid":
+        # Cryptomus doesn't echo custom fields, so the invoice key comes from order_id
+        order_user_id, plan = parse_order_id(order_id)
+        if order_user_id is not None:
+            delete_pending_invoice(order_user_id, plan)
+
     if status == "paid" and user_id:
         add_subscription(int(user_id), days=30)
         print(f"✅ User {user_id} subscribed for 30 days!")
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+import requests
+
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+# Prices younger than this are served from memory instead of CoinGecko
+PRICE_CACHE_TTL_SECONDS = 60
+
+# Upper bound on remembered unknown ids, which come straight from user input
+MAX_UNKNOWN_COINS = 500
+
+# Ticker symbol -> CoinGecko id, so users can type /price btc instead of /price bitcoin
+COIN_INDEX = {
+    "btc": "bitcoin",
+    "eth": "ethereum",
+    "usdt": "tether",
+    "bnb": "binancecoin",
+    "sol": "solana",
+    "usdc": "usd-coin",
+    "xrp": "ripple",
+    "doge": "dogecoin",
+    "ton": "the-open-network",
+    "ada": "cardano",
+    "trx": "tron",
+    "avax": "avalanche-2",
+    "dot": "polkadot",
+    "link": "chainlink",
+    "matic": "matic-network",
+    "ltc": "litecoin",
+    "bch": "bitcoin-cash",
+    "xlm": "stellar",
+    "atom": "cosmos",
+    "near": "near",
+}
+
+# coin id -> (usd price, fetched_at)
+_price_cache = {}
+# coin id CoinGecko didn't know -> checked_at, oldest first
+_unknown_coins = {}
+_cache_lock = threading.Lock()
+
+def resolve_coin(name):
+    name = name.strip().lower()
+    return COIN_INDEX.get(name, name)
+
+def get_cached_prices(coin_ids, now=None):
+    """Return {coin_id: (price, age_seconds)} for the coins that are still fresh."""
+    now = time.time() if now is None else now
+    fresh = {}
+    with _cache_lock:
+        for coin_id in coin_ids:
+            entry = _price_cache.get(coin_id)
+            if entry and now - entry[1] < PRICE_CACHE_TTL_SECONDS:
+                fresh[coin_id] = (entry[0], now - entry[1])
+    return fresh
+
+def store_prices(prices, now=None):
+    now = time.time() if now is None else now
+    with _cache_lock:
+        expired = [coin_id for coin_id, (_, fetched_at) in _price_cache.items()
+                   if now - fetched_at >= PRICE_CACHE_TTL_SECONDS]
+        for coin_id in expired:
+            del _price_cache[coin_id]
+        for coin_id, price in prices.items():
+            _price_cache[coin_id] = (price, now)
+
+def _recently_unknown(coin_ids, now):
+    with _cache_lock:
+        return {coin_id for coin_id in coin_ids
+                if now - _unknown_coins.get(coin_id, 0) < PRICE_CACHE_TTL_SECONDS}
+
+def remember_unknown(coin_ids, now=None):
+    now = time.time() if now is None else now
+    with _cache_lock:
+        for coin_id in coin_ids:
+            _unknown_coins.pop(coin_id, None)
+            _unknown_coins[coin_id] = now
+        # Oldest entries go first, whether expired or just crowded out
+        while _unknown_coins:
+            oldest = next(iter(_unknown_coins))
+            if len(_unknown_coins) <= MAX_UNKNOWN_COINS and now - _unknown_coins[oldest] < PRICE_CACHE_TTL_SECONDS:
+                break
+            del _unknown_coins[oldest]
+
+def get_crypto_prices(coin_ids):
+    """Return {coin_id: usd price}, fetching every stale coin in one CoinGecko call.
+
+    Coins CoinGecko doesn't know are missing from the result, and are
+    remembered as unknown for the TTL (up to MAX_UNKNOWN_COINS of them)
+    so they aren't looked up again.
+    """
+    coin_ids = list(dict.fromkeys(coin_ids))
+    now = time.time()
+    prices = {coin_id: price for coin_id, (price, _) in get_cached_prices(coin_ids, now).items()}
+    unknown = _recently_unknown(coin_ids, now)
+    missing = [coin_id for coin_id in coin_ids if coin_id not in prices and coin_id not in unknown]
+    if not missing:
+        return prices
+
+    params = {"ids": ",".join(missing), "vs_currencies": "usd"}
+    try:
+        response = requests.get(COINGECKO_API_URL, params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error fetching prices for {','.join(missing)}: {e}")
+        return prices
+
+    fetched = {
+        coin_id: data[coin_id]['usd']
+        for coin_id in missing
+        if data.get(coin_id) and data[coin_id].get('usd') is not None
+    }
+    store_prices(fetched)
+    remember_unknown([coin_id for coin_id in missing if coin_id not in fetched])
+    prices.update(fetched)
+    return prices
+
+def refresh_price_cache():
+    """Keep the indexed coins warm so inline queries never have to wait on CoinGecko."""
+    get_crypto_prices(COIN_INDEX.values())
@@ -1,36 +1,73 @@
 import os
+import asyncio
 import logging
+import math
 import requests
 import sqlite3
 import time
 from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
 from telegram.ext import (
     Application,
     CommandHandler,
     ContextTypes,
     CallbackQueryHandler,
     CallbackContext,
+    InlineQueryHandler,
 )
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 
+import metrics
+from alerts import evaluate_alerts
+from db import (
+    init_pending_invoices,
+    save_pending_invoice,
+    get_pending_invoice,
+    delete_pending_invoice,
+    delete_expired_invoices,
+)
+from prices import (
+    COIN_INDEX,
+    PRICE_CACHE_TTL_SECONDS,
+    get_cached_prices,
+    get_crypto_prices,
+    refresh_price_cache,
+    resolve_coin,
+)
+
 # --- Load environment variables ---
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-COINGECKO_API_URL = "https://api.coingecko.com/api/v3/simple/price"
 PAYMENT_GATEWAY_API_KEY = os.getenv("PAYMENT_GATEWAY_API_KEY") # Your payment gateway API key
 PAYMENT_GATEWAY_SECRET = os.getenv("PAYMENT_GATEWAY_SECRET") # Your payment gateway webhook secret
 
 DATABASE_NAME = "bot.db"
 
+# Upper bound on coins per /price or /portfolio request (one CoinGecko call)
+MAX_COINS_PER_REQUEST = 25
+
 # --- Subscription Plans ---
 SUBSCRIPTION_PLANS = {
     "monthly": {"name": "1 Month", "price_usd": 15.00, "duration_minutes": 43200},
 }
 
+COINBASE_CHARGES_URL = "https://api.commerce.coinbase.com/charges"
+INVOICE_LIFETIME_SECONDS = 3600  # Coinbase Commerce charges stay payable for an hour
+INVOICE_CLEANUP_MINUTES = 10
+METRICS_LOG_MINUTES = 5
+
+# (user_id, tier) -> task creating that invoice, so a double tap doesn't create a second one
+_invoice_tasks = {}
+
 # --- Logging ---
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -56,6 +93,7 @@ def initialize_db():
             )
         """)
         conn.commit()
+    init_pending_invoices(DATABASE_NAME)
 
 def set_premium_status(user_id: int, is_premium: bool, premium_until: int = None):
     with sqlite3.connect(DATABASE_NAME) as conn:
@@ -100,36 +138,101 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     message = (
         "Commands:\n\n"
-        "/price <crypto> - Get live price\n"
+        "/price <crypto> [crypto ...] - Get live prices (e.g. /price btc eth sol)\n"
+        "/portfolio <crypto>:<amount> ... - Value your holdings (e.g. /portfolio btc:0.5 eth:2)\n"
         "/premium - Get premium options (Automated alerts)\n"
         "/setalert <crypto> <price> <up/down> - Set premium price alert\n"
         "/status - Check premium status\n"
+        "\nInline: type @<bot> btc in any chat to share a price.\n"
     )
     await update.message.reply_text(message)
 
-async def get_crypto_price(ticker: str):
-    try:
-        params = {"ids": ticker, "vs_currencies": "usd"}
-        response = requests.get(COINGECKO_API_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if data.get(ticker) and data[ticker].get('usd'):
-            return data[ticker]['usd']
-        return None
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching price for {ticker}: {e}")
-        return None
-
 async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not context.args:
-        await update.message.reply_text("Usage: /price <cryptocurrency_name> (e.g., /price bitcoin)")
+        await update.message.reply_text("Usage: /price <crypto> [crypto ...] (e.g., /price btc eth sol)")
+        return
+    if len(context.args) > MAX_COINS_PER_REQUEST:
+        await update.message.reply_text(f"Please ask for at most {MAX_COINS_PER_REQUEST} coins at a time.")
+        return
+    coin_ids = list(dict.fromkeys(resolve_coin(arg) for arg in context.args))
+    prices = await asyncio.to_thread(get_crypto_prices, coin_ids)
+
+    if len(coin_ids) == 1:
+        ticker = coin_ids[0]
+        if ticker in prices:
+            await update.message.reply_text(f"The current price of {ticker.capitalize()} is ${prices[ticker]}")
+        else:
+            await update.message.reply_text(f"Could not find price for '{ticker}'.")
+        return
+
+    lines = [f"{coin_id.capitalize()}: ${prices[coin_id]}" for coin_id in coin_ids if coin_id in prices]
+    unknown = [coin_id for coin_id in coin_ids if coin_id not in prices]
+    if unknown:
+        lines.append(f"Could not find price for: {', '.join(unknown)}")
+    await update.message.reply_text("\n".join(lines))
+
+async def portfolio_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    usage = "Usage: /portfolio <crypto>:<amount> ... (e.g., /portfolio btc:0.5 eth:2)"
+    if not context.args:
+        await update.message.reply_text(usage)
+        return
+    if len(context.args) > MAX_COINS_PER_REQUEST:
+        await update.message.reply_text(f"Please list at most {MAX_COINS_PER_REQUEST} holdings at a time.")
         return
-    ticker = context.args[0].lower()
-    price = await get_crypto_price(ticker)
-    if price is not None:
-        await update.message.reply_text(f"The current price of {ticker.capitalize()} is ${price}")
+
+    holdings = {}
+    try:
+        for arg in context.args:
+            name, amount = arg.split(":", 1)
+            amount = float(amount)
+            if not math.isfinite(amount) or amount <= 0:
+                raise ValueError
+            coin_id = resolve_coin(name)
+            holdings[coin_id] = holdings.get(coin_id, 0.0) + amount
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+
+    prices = await asyncio.to_thread(get_crypto_prices, holdings.keys())
+    lines = []
+    total = 0.0
+    for coin_id, amount in holdings.items():
+        if coin_id not in prices:
+            lines.append(f"{coin_id.capitalize()}: price unavailable")
+            continue
+        value = amount * prices[coin_id]
+        total += value
+        lines.append(f"{coin_id.capitalize()}: {amount} × ${prices[coin_id]} = ${value:,.2f}")
+    lines.append(f"\nTotal: ${total:,.2f}")
+    await update.message.reply_text("\n".join(lines))
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Answered purely from memory: never hit CoinGecko on the inline path
+    query = update.inline_query.query.strip().lower()
+    if query:
+        coin_ids = list(dict.fromkeys(resolve_coin(term) for term in query.split()))
+        if len(coin_ids) == 1:
+            # Let a partial symbol like "et" offer every indexed coin starting with it
+            coin_ids += [coin_id for symbol, coin_id in COIN_INDEX.items()
+                         if symbol.startswith(query) and coin_id not in coin_ids]
     else:
-        await update.message.reply_text(f"Could not find price for '{ticker}'.")
+        coin_ids = list(COIN_INDEX.values())
+
+    cached = get_cached_prices(coin_ids[:50])
+    results = [
+        InlineQueryResultArticle(
+            id=coin_id,
+            title=f"{coin_id.capitalize()} ${price}",
+            input_message_content=InputTextMessageContent(
+                f"The current price of {coin_id.capitalize()} is ${price}"
+            ),
+        )
+        for coin_id, (price, _) in cached.items()
+    ]
+    # Let Telegram cache the answer for exactly as long as our prices stay fresh
+    oldest_age = max((age for _, age in cached.values()), default=PRICE_CACHE_TTL_SECONDS)
+    cache_time = max(1, int(PRICE_CACHE_TTL_SECONDS - oldest_age))
+    await update.inline_query.answer(results, cache_time=cache_time)
 
 async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = []
@@ -140,6 +243,60 @@ async def premium_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Unlock automated price alerts! Choose a plan below to proceed with payment.", reply_markup=reply_markup)
 
+def create_coinbase_charge(user_id: int, tier: str, plan: dict):
+    """Blocking POST to Coinbase Commerce; returns (charge_code, hosted_url, expires_at)."""
+    headers = {
+        "Content-Type": "application/json",
+        "X-CC-Api-Key": PAYMENT_GATEWAY_API_KEY,
+    }
+    body = {
+        "name": f"{plan['name']} Subscription",
+        "description": "Subscription for automated price alerts.",
+        "pricing_type": "fixed_price",
+        "local_price": {
+            "amount": plan['price_usd'],
+            "currency": "USD"
+        },
+        "redirect_url": "https://telegram.me/<your_bot_username>", # Replace with your bot's username
+        "metadata": {
+            "user_id": user_id,
+            "plan_tier": tier,
+        }
+    }
+    response = requests.post(COINBASE_CHARGES_URL, json=body, headers=headers, timeout=15)
+    response.raise_for_status()
+    charge = response.json()['data']
+    expires_at = time.time() + INVOICE_LIFETIME_SECONDS
+    if charge.get('expires_at'):
+        expires_at = datetime.fromisoformat(charge['expires_at'].replace('Z', '+00:00')).timestamp()
+    return charge.get('code'), charge['hosted_url'], expires_at
+
+def payment_message(plan: dict, payment_link: str):
+    message = (
+        f"**{plan['name']} Subscription**\n\n"
+        f"**Price:** `${plan['price_usd']}`\n\n"
+        f"Click the link below to pay and automatically activate your premium access!\n"
+    )
+    keyboard = [[InlineKeyboardButton("Pay Now", url=payment_link)]]
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def send_new_invoice(placeholder, user_id: int, tier: str, plan: dict) -> None:
+    try:
+        with metrics.timed("invoice.create"):
+            charge_code, payment_link, expires_at = await asyncio.to_thread(create_coinbase_charge, user_id, tier, plan)
+        with metrics.timed("invoice.store"):
+            save_pending_invoice(user_id, tier, "coinbase", charge_code, payment_link, expires_at, db_name=DATABASE_NAME)
+        metrics.increment("invoice.created")
+        message, reply_markup = payment_message(plan, payment_link)
+        await placeholder.edit_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+    except Exception as e:
+        metrics.increment("invoice.failed")
+        logging.error(f"Coinbase Commerce invoice error for user {user_id}: {e}")
+        try:
+            await placeholder.edit_text("There was an error generating the payment link. Please try again later.")
+        except Exception as edit_error:
+            logging.error(f"Error updating payment placeholder for user {user_id}: {edit_error}")
+
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -150,45 +307,30 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             await query.message.reply_text("Invalid subscription plan selected.")
             return
 
+        # Reuse a still-payable invoice instead of creating a new one on every tap
+        user_id = query.from_user.id
+        with metrics.timed("invoice.lookup"):
+            pending = get_pending_invoice(user_id, tier, db_name=DATABASE_NAME)
+        if pending:
+            metrics.increment("invoice.reused")
+            message, reply_markup = payment_message(plan, pending[1])
+            await query.message.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown')
+            return
+
+        key = (user_id, tier)
+        if key in _invoice_tasks:
+            # The placeholder from the first tap will be updated with the link
+            return
+
         # --- Automated Payment Gateway Logic using Coinbase Commerce (PLACEHOLDER) ---
-        api_key = PAYMENT_GATEWAY_API_KEY
-        if not api_key:
+        if not PAYMENT_GATEWAY_API_KEY:
             await query.message.reply_text("Payment gateway not configured. Please contact the administrator.")
             return
 
-        headers = {
-            "Content-Type": "application/json",
-            "X-CC-Api-Key": api_key,
-        }
-        body = {
-            "name": f"{plan['name']} Subscription",
-            "description": "Subscription for automated price alerts.",
-            "pricing_type": "fixed_price",
-            "local_price": {
-                "amount": plan['price_usd'],
-                "currency": "USD"
-            },
-            "redirect_url": "https://telegram.me/<your_bot_username>", # Replace with your bot's username
-            "metadata": {
-                "user_id": query.from_user.id,
-                "plan_tier": tier,
-            }
-        }
-        try:
-            response = requests.post("https://api.commerce.coinbase.com/charges", json=body, headers=headers)
-            response.raise_for_status()
-            payment_link = response.json()['data']['hosted_url']
-            message = (
-                f"**{plan['name']} Subscription**\n\n"
-                f"**Price:** `${plan['price_usd']}`\n\n"
-                f"Click the link below to pay and automatically activate your premium access!\n"
-            )
-            keyboard = [[InlineKeyboardButton("Pay Now", url=payment_link)]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.message.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Coinbase Commerce API Error: {e}")
-            await query.message.reply_text("There was an error generating the payment link. Please try again later.")
+        placeholder = await query.message.reply_text("⏳ Generating your payment link...")
+        task = context.application.create_task(send_new_invoice(placeholder, user_id, tier, plan))
+        _invoice_tasks[key] = task
+        task.add_done_callback(lambda _: _invoice_tasks.pop(key, None))
 
 async def set_alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -199,7 +341,7 @@ async def set_alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if len(context.args) != 3:
         await update.message.reply_text("Usage: /setalert <crypto> <price> <up/down>")
         return
-    crypto = context.args[0].lower()
+    crypto = resolve_coin(context.args[0])
     try:
         price = float(context.args[1])
         direction = context.args[2].lower()
@@ -230,36 +372,28 @@ async def check_alerts(context: CallbackContext):
     if not cryptos:
         return
 
-    params = {"ids": ",".join(cryptos), "vs_currencies": "usd"}
-    try:
-        response = requests.get(COINGECKO_API_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching prices for alerts: {e}")
+    prices = await asyncio.to_thread(get_crypto_prices, cryptos)
+    if not prices:
         return
+    data = {crypto: {'usd': price} for crypto, price in prices.items()}
 
-    for user_id, crypto, target_price, direction in alerts:
-        current_price = data.get(crypto, {}).get('usd')
-        if current_price is None:
-            continue
-
-        alert_triggered = False
-        if direction == "up" and current_price >= target_price:
-            alert_triggered = True
-        elif direction == "down" and current_price <= target_price:
-            alert_triggered = True
+    for (user_id, crypto, target_price, _), current_price in evaluate_alerts(alerts, data):
+        try:
+            await context.bot.send_message(
+                chat_id=user_id,
+                text=f"🔔 **ALERT!** {crypto.upper()} has hit your target price of ${target_price}. The current price is ${current_price}.",
+                parse_mode='Markdown'
+            )
+            deactivate_alert(user_id, crypto, target_price)
+        except Exception as e:
+            logging.error(f"Error sending alert to user {user_id}: {e}")
 
-        if alert_triggered:
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"🔔 **ALERT!** {crypto.upper()} has hit your target price of ${target_price}. The current price is ${current_price}.",
-                    parse_mode='Markdown'
-                )
-                deactivate_alert(user_id, crypto, target_price)
-            except Exception as e:
-                logging.error(f"Error sending alert to user {user_id}: {e}")
+# --- Background Task for Invoice Cleanup ---
+def cleanup_expired_invoices():
+    with metrics.timed("invoice.cleanup"):
+        deleted = delete_expired_invoices(DATABASE_NAME)
+    if deleted:
+        logging.info(f"Removed {deleted} expired pending invoices")
 
 
 # --- Webhook endpoint for automated payment gateway ---
@@ -282,6 +416,7 @@ async def handle_payment_webhook():
                 duration_minutes = plan['duration_minutes']
                 premium_until = int(time.time()) + duration_minutes * 60
                 set_premium_status(user_id, True, premium_until)
+                delete_pending_invoice(user_id, plan_tier, db_name=DATABASE_NAME)
 
                 # Send confirmation message to the user
                 application = Application.builder().token(TELEGRAM_TOKEN).build()
@@ -305,15 +440,20 @@ def main() -> None:
     application = Application.builder().token(TELEGRAM_TOKEN).build()
     scheduler = BackgroundScheduler()
     scheduler.add_job(check_alerts, 'interval', minutes=5, args=(application,))
+    scheduler.add_job(refresh_price_cache, 'interval', seconds=PRICE_CACHE_TTL_SECONDS // 2)
+    scheduler.add_job(cleanup_expired_invoices, 'interval', minutes=INVOICE_CLEANUP_MINUTES)
+    scheduler.add_job(metrics.log_snapshot, 'interval', minutes=METRICS_LOG_MINUTES)
     scheduler.start()
 
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("price", price_command))
+    application.add_handler(CommandHandler("portfolio", portfolio_command))
     application.add_handler(CommandHandler("premium", premium_command))
     application.add_handler(CommandHandler("setalert", set_alert_command))
     application.add_handler(CommandHandler("status", status_command))
     application.add_handler(CallbackQueryHandler(handle_callback_query))
+    application.add_handler(InlineQueryHandler(inline_query))
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":